@@ -1,14 +1,167 @@
-from datetime import datetime
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter, TimedOut, TelegramError
 from telegram.ext import ContextTypes
-from gas_utils import fetch_gas_data, get_eth_price, calculate_tx_cost
-from config import MIN_ALERT_PRICE, MAX_ALERT_PRICE, MAX_ALERTS_PER_USER, GAS_LIMITS
+from gas_utils import usd_per_gas
+from gas_cache import get_gas_cached
+from storage import (
+    load_alerts,
+    save_alert,
+    remove_alert,
+    remove_user_alerts,
+    mark_triggered,
+    purge_triggered
+)
+from config import (
+    MIN_ALERT_PRICE,
+    MAX_ALERT_PRICE,
+    MAX_ALERTS_PER_USER,
+    GAS_LIMITS,
+    ALERT_SEND_CONCURRENCY,
+    ALERT_SEND_RATE,
+    ALERT_SEND_RETRIES,
+    ALERT_DEDUP_WINDOW,
+    TRIGGERED_ALERT_RETENTION,
+    GAS_HARD_TTL
+)
 
 
-# In-memory storage for alerts
-# In production, replace with database (SQLite, PostgreSQL, etc.)
+log = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class Alert:
+    """A single gas price alert"""
+    id: int
+    price: float
+    created_at: int  # UNIX timestamp
+    triggered: bool = False
+
+
+# In-memory view of alerts: user_id -> {alert_id: Alert}
+# Written through to SQLite (see storage.py)
 user_alerts = {}
 
+# Max-heap (negated price) of untriggered alerts: (-price, user_id, alert_id).
+# Lets the background job stop at the first alert that cannot fire instead
+# of walking every alert of every user on each tick.
+_pending_heap = []
+
+# Ids of alerts removed by the user while still sitting in the heap
+_dead = set()
+
+# Users with at least one untriggered alert. When empty the alert job
+# skips its tick without touching the gas API at all.
+_users_with_pending = set()
+
+# Alert status labels shown in /myalerts
+_STATUS_TRIGGERED = "✅ Triggered"
+_STATUS_ACTIVE = "🟢 Active"
+_STATUS_BELOW = "⚠️ Below target"
+
+# Message templates, bound to str.format once at import time
+_ALERTS_HEADER_TMPL = "📋 <b>Your Gas Alerts</b>\n\n📊 Current Gas: <b>{current_gas:.2f} Gwei</b>\n\n".format
+
+_ALERT_ENTRY_TMPL = (
+    "<b>Alert #{index}</b>\n"
+    "🎯 Target: {price} Gwei\n"
+    "📍 Status: {status}\n"
+    "📅 Created: {created}\n\n"
+).format
+
+_ALERT_TRIGGER_TMPL = """🔔 <b>Gas Alert Triggered!</b>
+
+🎯 {targets}
+📊 Current gas: <b>{current_gas:.2f} Gwei</b>
+
+💰 <b>Sample Costs:</b>
+- ETH Transfer: ${eth_transfer:.2f}
+- Token Swap: ${token_swap:.2f}
+
+⚡ Great time to make your transaction!
+
+Use /gas to see full details.""".format
+
+# Gas limits of the sample transactions quoted in trigger notifications
+_TRIGGER_GAS_LIMITS = (GAS_LIMITS['eth_transfer'], GAS_LIMITS['token_swap'])
+
+# (user_id, price) -> monotonic time of the last notification for it
+_recently_notified = {}
+
+# Caps concurrent Telegram sends from the alert job
+_send_sem = asyncio.Semaphore(ALERT_SEND_CONCURRENCY)
+
+
+class _TokenBucket:
+    """Async token bucket limiting how many messages go out per second"""
+    
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Keeps bursts under Telegram's global ~30 messages/second limit
+_send_bucket = _TokenBucket(ALERT_SEND_RATE)
+
+
+def _compact_heap():
+    """Drop tombstoned entries once they make up more than half of the heap"""
+    if len(_dead) * 2 <= len(_pending_heap):
+        return
+    _pending_heap[:] = [entry for entry in _pending_heap if entry[2] not in _dead]
+    heapq.heapify(_pending_heap)
+    _dead.clear()
+
+
+def _update_pending_user(user_id: int):
+    """Track whether user_id still has any untriggered alerts"""
+    if any(not alert.triggered for alert in user_alerts.get(user_id, {}).values()):
+        _users_with_pending.add(user_id)
+    else:
+        _users_with_pending.discard(user_id)
+
+
+def restore_alerts():
+    """Rebuild in-memory alert state from the database on startup"""
+    user_alerts.clear()
+    _pending_heap.clear()
+    _dead.clear()
+    _users_with_pending.clear()
+    
+    for alert_id, user_id, price, created_at, triggered in load_alerts():
+        alert = Alert(alert_id, price, created_at, bool(triggered))
+        user_alerts.setdefault(user_id, {})[alert_id] = alert
+        if not alert.triggered:
+            _pending_heap.append((-price, user_id, alert_id))
+            _users_with_pending.add(user_id)
+    
+    heapq.heapify(_pending_heap)
+    return sum(len(alerts) for alerts in user_alerts.values())
+
 
 class AlertManager:
     """Manages user gas price alerts"""
@@ -26,12 +179,29 @@ class AlertManager:
             dict: Result with success status and message
         """
         # Validate price
-        if target_price < MIN_ALERT_PRICE or target_price > MAX_ALERT_PRICE:
+        # NaN compares False against everything and would wedge the heap
+        if not math.isfinite(target_price) or target_price < MIN_ALERT_PRICE or target_price > MAX_ALERT_PRICE:
             return {
                 'success': False,
                 'message': f"Price must be between {MIN_ALERT_PRICE} and {MAX_ALERT_PRICE} Gwei"
             }
         
+        # Reject duplicates of an alert that hasn't fired yet
+        for existing in user_alerts.get(user_id, {}).values():
+            if not existing.triggered and abs(existing.price - target_price) < 0.01:
+                return {
+                    'success': False,
+                    'message': f"You already have an alert set for {existing.price} Gwei"
+                }
+        
+        # Refuse to re-arm a price the user was just notified about
+        notified_at = _recently_notified.get((user_id, round(target_price, 2)))
+        if notified_at is not None and time.monotonic() - notified_at < ALERT_DEDUP_WINDOW:
+            return {
+                'success': False,
+                'message': f"Your {target_price} Gwei alert just fired. Try again in a few minutes."
+            }
+        
         # Check alert limit
         if user_id in user_alerts and len(user_alerts[user_id]) >= MAX_ALERTS_PER_USER:
             return {
@@ -39,17 +209,14 @@ class AlertManager:
                 'message': f"You can only have {MAX_ALERTS_PER_USER} active alerts. Please delete some first."
             }
         
-        # Create alert
-        if user_id not in user_alerts:
-            user_alerts[user_id] = []
-        
-        alert = {
-            'price': target_price,
-            'created_at': datetime.now(),
-            'triggered': False
-        }
+        # Create alert, persisting it before any in-memory state changes.
+        # The database assigns the id so it is never reused across restarts.
+        created_at = int(time.time())
+        alert = Alert(save_alert(user_id, target_price, created_at), target_price, created_at)
         
-        user_alerts[user_id].append(alert)
+        user_alerts.setdefault(user_id, {})[alert.id] = alert
+        heapq.heappush(_pending_heap, (-target_price, user_id, alert.id))
+        _users_with_pending.add(user_id)
         
         return {
             'success': True,
@@ -58,31 +225,42 @@ class AlertManager:
         }
     
     @staticmethod
-    def get_user_alerts(user_id: int) -> list:
-        """Get all alerts for a user"""
-        return user_alerts.get(user_id, [])
+    def get_user_alerts(user_id: int) -> dict:
+        """Get all alerts for a user, keyed by alert id"""
+        return user_alerts.get(user_id, {})
     
     @staticmethod
     def clear_user_alerts(user_id: int) -> int:
         """Clear all alerts for a user. Returns count of cleared alerts."""
-        if user_id in user_alerts:
-            count = len(user_alerts[user_id])
-            user_alerts[user_id] = []
-            return count
+        alerts = user_alerts.pop(user_id, None)
+        if alerts:
+            for alert in alerts.values():
+                if not alert.triggered:
+                    _dead.add(alert.id)
+            remove_user_alerts(user_id)
+            _users_with_pending.discard(user_id)
+            _compact_heap()
+            return len(alerts)
         return 0
     
     @staticmethod
-    def delete_alert(user_id: int, alert_index: int) -> bool:
-        """Delete a specific alert by index"""
-        if user_id in user_alerts and 0 <= alert_index < len(user_alerts[user_id]):
-            user_alerts[user_id].pop(alert_index)
-            return True
-        return False
+    def delete_alert(user_id: int, alert_id: int) -> bool:
+        """Delete a specific alert by id"""
+        alert = user_alerts.get(user_id, {}).pop(alert_id, None)
+        if alert is None:
+            return False
+        
+        remove_alert(alert.id)
+        if not alert.triggered:
+            _dead.add(alert.id)
+            _update_pending_user(user_id)
+            _compact_heap()
+        return True
     
     @staticmethod
     def has_alerts(user_id: int) -> bool:
         """Check if user has any alerts"""
-        return user_id in user_alerts and len(user_alerts[user_id]) > 0
+        return bool(user_alerts.get(user_id))
     
     @staticmethod
     def format_alerts_message(user_id: int, current_gas: float) -> str:
@@ -96,26 +274,65 @@ You don't have any active alerts.
 
 Use /setalert to create one!"""
         
-        message = f"📋 <b>Your Gas Alerts</b>\n\n📊 Current Gas: <b>{current_gas:.2f} Gwei</b>\n\n"
+        parts = [_ALERTS_HEADER_TMPL(current_gas=current_gas)]
         
-        for i, alert in enumerate(alerts, 1):
-            price = alert['price']
+        for i, alert in enumerate(alerts.values(), 1):
+            price = alert.price
             
-            if alert['triggered']:
-                status = "✅ Triggered"
+            if alert.triggered:
+                status = _STATUS_TRIGGERED
             elif current_gas > price:
-                status = "🟢 Active"
+                status = _STATUS_ACTIVE
             else:
-                status = "⚠️ Below target"
+                status = _STATUS_BELOW
             
-            created = alert['created_at'].strftime('%Y-%m-%d %H:%M')
+            created = datetime.fromtimestamp(alert.created_at, timezone.utc).strftime('%Y-%m-%d %H:%M UTC')
             
-            message += f"<b>Alert #{i}</b>\n"
-            message += f"🎯 Target: {price} Gwei\n"
-            message += f"📍 Status: {status}\n"
-            message += f"📅 Created: {created}\n\n"
+            parts.append(_ALERT_ENTRY_TMPL(index=i, price=price, status=status, created=created))
         
-        return message
+        return "".join(parts)
+
+
+async def cleanup_alerts(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Background job to drop old triggered alerts
+    Users whose alerts are all gone are removed from user_alerts entirely
+    """
+    cutoff = int(time.time()) - TRIGGERED_ALERT_RETENTION
+    removed = 0
+    
+    for user_id, alerts in list(user_alerts.items()):
+        expired = [
+            alert_id for alert_id, alert in alerts.items()
+            if alert.triggered and alert.created_at < cutoff
+        ]
+        for alert_id in expired:
+            del alerts[alert_id]
+        removed += len(expired)
+        
+        if not alerts:
+            del user_alerts[user_id]
+    
+    purge_triggered(cutoff)
+    
+    if removed > 0:
+        log.info("Cleaned up %d old triggered alert(s)", removed)
+
+
+def _format_bulk_trigger(alerts: list, current_gas: float, eth_transfer: float, token_swap: float) -> str:
+    """Format a single notification covering all of a user's triggered alerts"""
+    if len(alerts) == 1:
+        targets = f"Your target: <b>{alerts[0].price} Gwei</b>"
+    else:
+        prices = ", ".join(str(alert.price) for alert in alerts)
+        targets = f"Your targets: <b>{prices} Gwei</b>"
+    
+    return _ALERT_TRIGGER_TMPL(
+        targets=targets,
+        current_gas=current_gas,
+        eth_transfer=eth_transfer,
+        token_swap=token_swap
+    )
 
 
 async def check_and_notify_alerts(context: ContextTypes.DEFAULT_TYPE):
@@ -123,93 +340,162 @@ async def check_and_notify_alerts(context: ContextTypes.DEFAULT_TYPE):
     Background job to check alerts and send notifications
     This function is called periodically by the job queue
     """
-    # Fetch current gas data
-    gas_data = fetch_gas_data()
-    if not gas_data:
-        print("Failed to fetch gas data for alert checking")
+    if not _users_with_pending:
         return
     
-    current_gas = float(gas_data.get('ProposeGasPrice', 0))
+    # Fetch current gas data; never fire alerts on data past its hard TTL
+    snapshot = await get_gas_cached(max_age=GAS_HARD_TTL)
+    if not snapshot:
+        log.warning("Failed to fetch gas data for alert checking")
+        return
+    
+    current_gas = snapshot.propose
+    eth_price = snapshot.eth_price
     if current_gas == 0:
-        print("Invalid gas price received")
+        log.warning("Invalid gas price received")
         return
     
-    eth_price = get_eth_price()
+    log.debug("Checking alerts... Current gas: %.2f Gwei", current_gas)
     
-    print(f"Checking alerts... Current gas: {current_gas:.2f} Gwei")
+    # Forget dedup entries older than the suppression window
+    now = time.monotonic()
+    for key, notified_at in list(_recently_notified.items()):
+        if now - notified_at >= ALERT_DEDUP_WINDOW:
+            del _recently_notified[key]
     
-    # Check each user's alerts
-    notifications_sent = 0
+    # Pop every untriggered alert whose target is at or above current gas
+    triggered_ids = []
+    triggered_users = set()
+    per_user = defaultdict(list)
     
-    for user_id, alerts in user_alerts.items():
-        for alert in alerts:
-            # Check if alert should trigger
-            if not alert['triggered'] and current_gas <= alert['price']:
-                # Mark as triggered
-                alert['triggered'] = True
-                
-                # Calculate sample costs
-                eth_transfer = calculate_tx_cost(current_gas, GAS_LIMITS['eth_transfer'], eth_price)
-                token_swap = calculate_tx_cost(current_gas, GAS_LIMITS['token_swap'], eth_price)
-                
-                # Create notification message
-                message = f"""🔔 <b>Gas Alert Triggered!</b>
+    while _pending_heap and -_pending_heap[0][0] >= current_gas:
+        _, user_id, alert_id = heapq.heappop(_pending_heap)
+        if alert_id in _dead:
+            _dead.discard(alert_id)
+            continue
+        
+        alert = user_alerts.get(user_id, {}).get(alert_id)
+        if alert is None:
+            continue
+        
+        # Mark as triggered
+        alert.triggered = True
+        triggered_ids.append(alert_id)
+        triggered_users.add(user_id)
+        
+        # Remembered so add_alert can refuse an immediate re-add of this price
+        _recently_notified[(user_id, round(alert.price, 2))] = now
+        
+        per_user[user_id].append(alert)
+    
+    mark_triggered(triggered_ids)
+    for user_id in triggered_users:
+        _update_pending_user(user_id)
+    
+    if not per_user:
+        return
+    
+    # Sample costs are the same for everyone this tick, so compute them once
+    gas_usd = usd_per_gas(current_gas, eth_price)
+    eth_transfer, token_swap = (gas_usd * limit for limit in _TRIGGER_GAS_LIMITS)
+    
+    # One message per user, however many of their alerts fired
+    keyboard = _KEYBOARDS['triggered']
+    pending = [
+        (user_id, _format_bulk_trigger(alerts, current_gas, eth_transfer, token_swap), keyboard)
+        for user_id, alerts in per_user.items()
+    ]
+    
+    # Deliver in the background so the job returns without waiting on Telegram
+    context.application.create_task(_deliver(context.bot, pending))
 
-🎯 Your target: <b>{alert['price']} Gwei</b>
-📊 Current gas: <b>{current_gas:.2f} Gwei</b>
 
-💰 <b>Sample Costs:</b>
-- ETH Transfer: ${eth_transfer:.2f}
-- Token Swap: ${token_swap:.2f}
+async def _deliver(bot, pending: list):
+    """Send (user_id, text, reply_markup) notifications concurrently"""
+    results = await asyncio.gather(
+        *[_safe_send(bot, *notification) for notification in pending]
+    )
+    notifications_sent = sum(results)
+    
+    if notifications_sent > 0:
+        log.info("Sent %d alert notification(s)", notifications_sent)
 
-⚡ Great time to make your transaction!
 
-Use /gas to see full details."""
-                
-                keyboard = [[InlineKeyboardButton("⛽ View Gas Prices", callback_data="refresh")]]
-                
-                # Send notification
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text=message,
-                        parse_mode='HTML',
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-                    notifications_sent += 1
-                    print(f"Alert notification sent to user {user_id}")
-                except Exception as e:
-                    print(f"Error sending alert to user {user_id}: {e}")
+async def _safe_send(bot, user_id: int, text: str, reply_markup) -> bool:
+    """
+    Send a single alert notification, honouring Telegram flood control
     
-    if notifications_sent > 0:
-        print(f"Sent {notifications_sent} alert notification(s)")
+    Retries on RetryAfter (waiting exactly as long as Telegram asks) and on
+    TimedOut (exponential backoff). Returns True if delivered.
+    """
+    async with _send_sem:
+        for attempt in range(ALERT_SEND_RETRIES):
+            await _send_bucket.acquire()
+            try:
+                await bot.send_message(
+                    chat_id=user_id,
+                    text=text,
+                    parse_mode='HTML',
+                    reply_markup=reply_markup
+                )
+                log.debug("Alert notification sent to user %d", user_id)
+                return True
+            except RetryAfter as e:
+                log.debug("Rate limited sending to user %d, retrying in %ss", user_id, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+            except TimedOut:
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError as e:
+                log.debug("Error sending alert to user %d: %s", user_id, e)
+                return False
+        
+        log.warning("Giving up on alert for user %d after %d attempts", user_id, ALERT_SEND_RETRIES)
+        return False
+
+
+# Keyboard layouts are immutable, so build them once at import time
+_KEYBOARDS = {
+    'main': InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("🔄 Refresh", callback_data="refresh"),
+            InlineKeyboardButton("⏰ Set Alert", callback_data="set_alert")
+        ],
+        [
+            InlineKeyboardButton("📋 My Alerts", callback_data="view_alerts"),
+            InlineKeyboardButton("ℹ️ Help", callback_data="help")
+        ]
+    ]),
+    
+    'alerts_view': InlineKeyboardMarkup([
+        [InlineKeyboardButton("🗑️ Clear All Alerts", callback_data="clear_alerts")],
+        [InlineKeyboardButton("⏰ Add New Alert", callback_data="set_alert")],
+        [InlineKeyboardButton("🔙 Back", callback_data="refresh")]
+    ]),
+    
+    'no_alerts': InlineKeyboardMarkup([
+        [InlineKeyboardButton("⏰ Set Alert", callback_data="set_alert")]
+    ]),
+    
+    'after_set': InlineKeyboardMarkup([
+        [InlineKeyboardButton("⛽ Check Gas Now", callback_data="refresh")]
+    ]),
+    
+    'triggered': InlineKeyboardMarkup([
+        [InlineKeyboardButton("⛽ View Gas Prices", callback_data="refresh")]
+    ])
+}
 
 
 def get_alert_keyboards():
     """Get keyboard layouts for alert-related messages"""
-    return {
-        'main': InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("🔄 Refresh", callback_data="refresh"),
-                InlineKeyboardButton("⏰ Set Alert", callback_data="set_alert")
-            ],
-            [
-                InlineKeyboardButton("📋 My Alerts", callback_data="view_alerts"),
-                InlineKeyboardButton("ℹ️ Help", callback_data="help")
-            ]
-        ]),
-        
-        'alerts_view': InlineKeyboardMarkup([
-            [InlineKeyboardButton("🗑️ Clear All Alerts", callback_data="clear_alerts")],
-            [InlineKeyboardButton("⏰ Add New Alert", callback_data="set_alert")],
-            [InlineKeyboardButton("🔙 Back", callback_data="refresh")]
-        ]),
-        
-        'no_alerts': InlineKeyboardMarkup([
-            [InlineKeyboardButton("⏰ Set Alert", callback_data="set_alert")]
-        ]),
-        
-        'after_set': InlineKeyboardMarkup([
-            [InlineKeyboardButton("⛽ Check Gas Now", callback_data="refresh")]
-        ])
-    }
\ No newline at end of file
+    return _KEYBOARDS
+
+
+def get_alerts_view_keyboard(user_id: int):
+    """Get the /myalerts keyboard with a delete button for each of the user's alerts"""
+    buttons = [
+        InlineKeyboardButton(f"🗑️ #{i}", callback_data=f"del:{alert_id}")
+        for i, alert_id in enumerate(AlertManager.get_user_alerts(user_id), 1)
+    ]
+    rows = [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+    return InlineKeyboardMarkup(rows + list(_KEYBOARDS['alerts_view'].inline_keyboard))
@@ -5,10 +5,21 @@ from dotenv import load_dotenv
 load_dotenv()
 ETHERSCAN_API_KEY = os.getenv('ETHERSCAN_API_KEY')
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+ALERTS_DB_PATH = os.getenv('ALERTS_DB_PATH', 'alerts.db')
+
+# Webhook mode: set WEBHOOK_URL to receive updates by push instead of long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or None
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
 
 # Bot Settings
 ALERT_CHECK_INTERVAL = 300  # Check alerts every 5 minutes (in seconds)
 ALERT_CHECK_FIRST_RUN = 10  # First check after 10 seconds
+ALERT_CLEANUP_INTERVAL = 3600  # Drop old triggered alerts every hour (in seconds)
+GAS_REFRESH_INTERVAL = 12  # Refetch gas data in the background about once per block (in seconds)
+ETH_REFRESH_INTERVAL = 90  # Refetch the ETH price in the background (in seconds)
+REFRESH_DEBOUNCE = 2.0  # Ignore repeated Refresh taps in a chat within this window (in seconds)
 
 # Gas Limits (in gas units)
 GAS_LIMITS = {
@@ -30,4 +41,22 @@ GAS_STATUS_THRESHOLDS = {
 # Alert Settings
 MIN_ALERT_PRICE = 0.1
 MAX_ALERT_PRICE = 1000
-MAX_ALERTS_PER_USER = 10
\ No newline at end of file
+MAX_ALERTS_PER_USER = 10
+ALERT_SEND_CONCURRENCY = 20  # Max simultaneous alert notifications in flight
+ALERT_SEND_RATE = 30  # Max alert notifications per second (Telegram flood limit)
+ALERT_SEND_RETRIES = 5  # Attempts per notification on RetryAfter/TimedOut
+ALERT_DEDUP_WINDOW = 600  # Refuse re-adding an alert for a price that just fired (in seconds)
+TRIGGERED_ALERT_RETENTION = 86400  # Keep triggered alerts this long after creation (in seconds)
+
+# HTTP Settings
+HTTP_TIMEOUT = 10  # Total timeout for Etherscan/CoinGecko requests (in seconds)
+HTTP_RETRIES = 3  # Attempts per request on connection errors/timeouts
+HTTP_MIN_INTERVAL = 0.25  # Minimum gap between requests to the same endpoint (in seconds)
+FETCH_DEADLINE = 6  # Max time a handler waits on upstream before serving stale data (in seconds)
+
+# Cache Settings (in seconds)
+# Fresh for *_TTL; served stale while refreshing in the background until *_HARD_TTL
+GAS_TTL = 15
+GAS_HARD_TTL = 120
+ETH_TTL = 120
+ETH_HARD_TTL = 600
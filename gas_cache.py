@@ -0,0 +1,134 @@
+"""
+Shared TTL cache for gas and ETH price data
+Collapses concurrent handler requests into a single upstream fetch
+"""
+import asyncio
+import time
+from gas_utils import fetch_gas_data, get_eth_price, parse_gas_snapshot
+from config import GAS_TTL, GAS_HARD_TTL, ETH_TTL, ETH_HARD_TTL, FETCH_DEADLINE
+
+
+# key -> (monotonic timestamp, value)
+_cache = {}
+
+_fetchers = {
+    'gas': fetch_gas_data,
+    'eth': get_eth_price
+}
+
+# key -> (ttl, hard_ttl). Gas moves every block, ETH/USD far more slowly.
+_ttls = {
+    'gas': (GAS_TTL, GAS_HARD_TTL),
+    'eth': (ETH_TTL, ETH_HARD_TTL)
+}
+
+# key -> Task fetching a fresh value. Every caller that needs a refresh
+# while one is in flight awaits the same task instead of refetching.
+_inflight = {}
+
+# GasSnapshot built from the current cache entries, reset on every refresh
+_snapshot = None
+
+
+async def _fetch(key: str):
+    """Fetch a fresh value for key and store it. Returns None on failure."""
+    global _snapshot
+    value = await _fetchers[key]()
+    if value is not None:
+        _cache[key] = (time.monotonic(), value)
+        _snapshot = None
+    return value
+
+
+def _refresh(key: str) -> asyncio.Task:
+    """Start a fetch for key, or join the one already in flight"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch(key))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+
+async def _get(key: str):
+    """
+    Get a cached value, fetching it if missing or too old
+    
+    Fresh entries are returned as-is. Entries older than ttl but younger
+    than hard_ttl are returned immediately while a background refresh runs.
+    Concurrent callers on a cold entry share a single fetch.
+    """
+    ttl, hard_ttl = _ttls[key]
+    entry = _cache.get(key)
+    if entry:
+        age = time.monotonic() - entry[0]
+        if age < ttl:
+            return entry[1]
+        if age < hard_ttl:
+            _refresh(key)
+            return entry[1]
+    
+    # Shield so one cancelled caller doesn't cancel the fetch for the others
+    return await asyncio.shield(_refresh(key))
+
+
+def is_cache_warm() -> bool:
+    """Check if get_gas_cached() can answer without waiting on the network"""
+    now = time.monotonic()
+    for key in _fetchers:
+        entry = _cache.get(key)
+        if not entry or now - entry[0] >= _ttls[key][1]:
+            return False
+    return True
+
+
+async def get_gas_cached(max_age: float = None):
+    """
+    Get current gas prices and ETH price, served from cache when fresh
+    
+    If upstream doesn't answer within FETCH_DEADLINE, the last cached
+    values are served regardless of age, unless max_age is given.
+    
+    Args:
+        max_age: Oldest cached data (in seconds) acceptable on timeout
+        
+    Returns:
+        GasSnapshot or None if gas data is unavailable
+    """
+    global _snapshot
+    # On a cold cache both upstream requests run concurrently under one deadline
+    try:
+        async with asyncio.timeout(FETCH_DEADLINE):
+            async with asyncio.TaskGroup() as tg:
+                gas_task = tg.create_task(_get('gas'))
+                eth_task = tg.create_task(_get('eth'))
+        gas_data, eth_price = gas_task.result(), eth_task.result()
+    except TimeoutError:
+        # The shielded fetches keep running and will fill the cache for the
+        # next caller; answer now with whatever we last had, however old.
+        gas_entry, eth_entry = _cache.get('gas'), _cache.get('eth')
+        if not gas_entry or not eth_entry:
+            return None
+        if max_age is not None and time.monotonic() - gas_entry[0] >= max_age:
+            return None
+        gas_data, eth_price = gas_entry[1], eth_entry[1]
+    
+    # The memoised snapshot outlives a failed refresh; don't serve it past hard_ttl
+    if gas_data is None:
+        return None
+    
+    if _snapshot is None:
+        # Report when the gas data was fetched, not when it was first read
+        fetched_at = time.time() - (time.monotonic() - _cache['gas'][0])
+        _snapshot = parse_gas_snapshot(gas_data, eth_price, fetched_at)
+    return _snapshot
+
+
+async def refresh_gas_job(context):
+    """Background job that keeps gas data warm so handlers only read from memory"""
+    await _refresh('gas')
+
+
+async def refresh_eth_job(context):
+    """Background job that keeps the ETH price warm, on its own slower cadence"""
+    await _refresh('eth')
@@ -2,6 +2,9 @@
 Ethereum Gas Tracker Telegram Bot
 Main bot file with command handlers and conversation flows
 """
+import logging
+import time
+from urllib.parse import urlparse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -20,38 +23,39 @@ from config import (
     TELEGRAM_BOT_TOKEN,
     ETHERSCAN_API_KEY,
     ALERT_CHECK_INTERVAL,
-    ALERT_CHECK_FIRST_RUN
-)
-from gas_utils import (
-    fetch_gas_data,
-    get_eth_price,
-    format_gas_message
+    ALERT_CHECK_FIRST_RUN,
+    ALERT_CLEANUP_INTERVAL,
+    GAS_REFRESH_INTERVAL,
+    ETH_REFRESH_INTERVAL,
+    REFRESH_DEBOUNCE,
+    WEBHOOK_URL,
+    WEBHOOK_SECRET,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT
 )
+from gas_utils import format_gas_message, init_http_session, close_http_session
+from gas_cache import get_gas_cached, is_cache_warm, refresh_gas_job, refresh_eth_job
 from alerts import (
     AlertManager,
     check_and_notify_alerts,
-    get_alert_keyboards
+    cleanup_alerts,
+    get_alert_keyboards,
+    get_alerts_view_keyboard,
+    restore_alerts
 )
+from storage import init_db
 # ============================================================================
 
+log = logging.getLogger(__name__)
+
 # Conversation states
 WAITING_FOR_ALERT_PRICE = 1
 
 
 # ============================================================================
-# KEYBOARD HELPERS
+# MESSAGE TEMPLATES
 # ============================================================================
-def create_main_keyboard():
-    """Create main inline keyboard - NOW INCLUDES ALERT BUTTON"""
-    return get_alert_keyboards()['main']
-
-
-# ============================================================================
-# COMMAND HANDLERS
-# ============================================================================
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /start command"""
-    welcome_message = """👋 <b>Welcome to Ethereum Gas Tracker Bot!</b>
+_WELCOME_TEXT = """👋 <b>Welcome to Ethereum Gas Tracker Bot!</b>
 
 I help you monitor Ethereum gas prices in real-time.
 
@@ -62,37 +66,8 @@ I help you monitor Ethereum gas prices in real-time.
 /help - Show help information
 
 Click the button below to check current gas prices! ⬇️"""
-    
-    keyboard = [[InlineKeyboardButton("⛽ Check Gas Prices", callback_data="refresh")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.message.reply_text(
-        welcome_message,
-        parse_mode='HTML',
-        reply_markup=reply_markup
-    )
-
-
-async def gas_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /gas command"""
-    message = await update.message.reply_text("⏳ Fetching current gas prices...")
-    
-    gas_data = fetch_gas_data()
-    eth_price = get_eth_price()
-    
-    gas_message = format_gas_message(gas_data, eth_price)
-    keyboard = create_main_keyboard()
-    
-    await message.edit_text(
-        gas_message,
-        parse_mode='HTML',
-        reply_markup=keyboard
-    )
 
-
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /help command"""
-    help_text = """<b>🤖 Gas Tracker Bot Help</b>
+_HELP_TEXT = """<b>🤖 Gas Tracker Bot Help</b>
 
 <b>Commands:</b>
 /start - Start the bot
@@ -121,19 +96,23 @@ Set alerts to be notified when gas drops below your target price. The bot checks
 - Use "Low" for non-urgent transactions
 
 Need more help? Contact @YourSupportUsername"""
-    
-    await update.message.reply_text(help_text, parse_mode='HTML')
 
+_QUICK_HELP_TEXT = """<b>🤖 Quick Help</b>
 
-# ============================================================================
-# ALERT COMMAND HANDLERS (NEW)
-# ============================================================================
-async def set_alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /setalert command - START CONVERSATION"""
-    gas_data = fetch_gas_data()
-    current_gas = gas_data.get('ProposeGasPrice', 'N/A') if gas_data else 'N/A'
-    
-    message = f"""⏰ <b>Set Gas Price Alert</b>
+<b>Button Functions:</b>
+🔄 Refresh - Update gas prices
+⏰ Set Alert - Create price alerts
+📋 My Alerts - View your alerts
+ℹ️ Help - Show this message
+
+<b>Commands:</b>
+/gas - Get current prices
+/setalert - Set alert
+/myalerts - View alerts
+
+Use /help for detailed information."""
+
+_SET_ALERT_TMPL = """⏰ <b>Set Gas Price Alert</b>
 
 Current gas price: <b>{current_gas} Gwei</b>
 
@@ -143,7 +122,86 @@ For example:
 - Send <code>10</code> to be alerted when gas drops below 10 Gwei
 - Send <code>15</code> for 15 Gwei alert
 
-Send /cancel to cancel."""
+Send /cancel to cancel.""".format
+
+_ALERT_SET_TMPL = """✅ <b>Alert Set Successfully!</b>
+
+🎯 Target: <b>{alert_price} Gwei</b>
+📊 Current: <b>{current_gas:.2f} Gwei</b>
+📍 Status: {status}
+
+You'll be notified when gas drops below {alert_price} Gwei!
+
+Use /myalerts to view all your alerts.""".format
+
+
+# ============================================================================
+# KEYBOARD HELPERS
+# ============================================================================
+_MAIN_KB = get_alert_keyboards()['main']
+
+_START_KB = InlineKeyboardMarkup([[InlineKeyboardButton("⛽ Check Gas Prices", callback_data="refresh")]])
+
+_CHECK_GAS_KB = InlineKeyboardMarkup([[InlineKeyboardButton("⛽ Check Gas", callback_data="refresh")]])
+
+
+def create_main_keyboard():
+    """Create main inline keyboard - NOW INCLUDES ALERT BUTTON"""
+    return _MAIN_KB
+
+
+# ============================================================================
+# COMMAND HANDLERS
+# ============================================================================
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /start command"""
+    await update.message.reply_text(
+        _WELCOME_TEXT,
+        parse_mode='HTML',
+        reply_markup=_START_KB
+    )
+
+
+async def gas_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /gas command"""
+    # Only show a placeholder when we actually have to wait on the API
+    placeholder = None
+    if not is_cache_warm():
+        placeholder = await update.message.reply_text("⏳ Fetching current gas prices...")
+    
+    snapshot = await get_gas_cached()
+    
+    gas_message = format_gas_message(snapshot)
+    keyboard = create_main_keyboard()
+    
+    if placeholder:
+        await placeholder.edit_text(
+            gas_message,
+            parse_mode='HTML',
+            reply_markup=keyboard
+        )
+    else:
+        await update.message.reply_text(
+            gas_message,
+            parse_mode='HTML',
+            reply_markup=keyboard
+        )
+
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /help command"""
+    await update.message.reply_text(_HELP_TEXT, parse_mode='HTML')
+
+
+# ============================================================================
+# ALERT COMMAND HANDLERS (NEW)
+# ============================================================================
+async def set_alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /setalert command - START CONVERSATION"""
+    snapshot = await get_gas_cached()
+    current_gas = f"{snapshot.propose:.2f}" if snapshot else 'N/A'
+    
+    message = _SET_ALERT_TMPL(current_gas=current_gas)
     
     await update.message.reply_text(message, parse_mode='HTML')
     return WAITING_FOR_ALERT_PRICE
@@ -167,20 +225,12 @@ async def receive_alert_price(update: Update, context: ContextTypes.DEFAULT_TYPE
             return WAITING_FOR_ALERT_PRICE
         
         # Get current gas for comparison
-        gas_data = fetch_gas_data()
-        current_gas = float(gas_data.get('ProposeGasPrice', 0)) if gas_data else 0
+        snapshot = await get_gas_cached()
+        current_gas = snapshot.propose if snapshot else 0
         
         status = "🟢 Active" if current_gas > alert_price else "⚠️ Already below target"
         
-        message = f"""✅ <b>Alert Set Successfully!</b>
-
-🎯 Target: <b>{alert_price} Gwei</b>
-📊 Current: <b>{current_gas:.2f} Gwei</b>
-📍 Status: {status}
-
-You'll be notified when gas drops below {alert_price} Gwei!
-
-Use /myalerts to view all your alerts."""
+        message = _ALERT_SET_TMPL(alert_price=alert_price, current_gas=current_gas, status=status)
         
         keyboard = get_alert_keyboards()['after_set']
         
@@ -199,9 +249,7 @@ async def cancel_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancel alert setup - END CONVERSATION"""
     await update.message.reply_text(
         "❌ Alert setup cancelled.",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("⛽ Check Gas", callback_data="refresh")
-        ]])
+        reply_markup=_CHECK_GAS_KB
     )
     return ConversationHandler.END
 
@@ -219,11 +267,11 @@ async def view_alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    gas_data = fetch_gas_data()
-    current_gas = float(gas_data.get('ProposeGasPrice', 0)) if gas_data else 0
+    snapshot = await get_gas_cached()
+    current_gas = snapshot.propose if snapshot else 0
     
     alerts_text = AlertManager.format_alerts_message(user_id, current_gas)
-    keyboard = get_alert_keyboards()['alerts_view']
+    keyboard = get_alerts_view_keyboard(user_id)
     
     await update.message.reply_text(
         alerts_text,
@@ -238,47 +286,61 @@ async def view_alerts_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
+    
+    # Coalesce rapid Refresh taps in the same chat
+    if query.data == "refresh":
+        now = time.monotonic()
+        if now - context.chat_data.get('last_refresh', 0) < REFRESH_DEBOUNCE:
+            await query.answer("✔ Already up-to-date")
+            return
+        context.chat_data['last_refresh'] = now
+    
     await query.answer()
     
+    # Other buttons replace the message text, so forget which gas message it showed
+    if query.data != "refresh":
+        context.chat_data.pop('last_gas_message', None)
+    
     if query.data == "refresh":
-        await query.edit_message_text("⏳ Fetching latest gas prices...")
+        placeholder_shown = not is_cache_warm()
+        if placeholder_shown:
+            await query.edit_message_text("⏳ Fetching latest gas prices...")
         
-        gas_data = fetch_gas_data()
-        eth_price = get_eth_price()
+        snapshot = await get_gas_cached()
         
-        gas_message = format_gas_message(gas_data, eth_price)
+        gas_message = format_gas_message(snapshot)
         keyboard = create_main_keyboard()
         
+        # Telegram rejects edits that don't change the message, so skip the
+        # round-trip when this message already shows exactly this text
+        rendered = (query.message.message_id, hash(gas_message))
+        if not placeholder_shown and context.chat_data.get('last_gas_message') == rendered:
+            return
+        
         await query.edit_message_text(
             gas_message,
             parse_mode='HTML',
             reply_markup=keyboard
         )
+        context.chat_data['last_gas_message'] = rendered
     
     # ========================================================================
     # ALERT-RELATED CALLBACKS (NEW)
     # ========================================================================
     elif query.data == "set_alert":
-        gas_data = fetch_gas_data()
-        current_gas = gas_data.get('ProposeGasPrice', 'N/A') if gas_data else 'N/A'
+        snapshot = await get_gas_cached()
+        current_gas = f"{snapshot.propose:.2f}" if snapshot else 'N/A'
         
-        message = f"""⏰ <b>Set Gas Price Alert</b>
-
-Current gas price: <b>{current_gas} Gwei</b>
-
-Please send me the gas price (in Gwei) you want to be alerted at.
-
-For example:
-- Send <code>10</code> to be alerted when gas drops below 10 Gwei
-- Send <code>15</code> for 15 Gwei alert
-
-Send /cancel to cancel."""
+        message = _SET_ALERT_TMPL(current_gas=current_gas)
         
         await query.edit_message_text(message, parse_mode='HTML')
     
-    elif query.data == "view_alerts":
+    elif query.data == "view_alerts" or query.data.startswith("del:"):
         user_id = query.from_user.id
         
+        if query.data.startswith("del:"):
+            AlertManager.delete_alert(user_id, int(query.data[4:]))
+        
         if not AlertManager.has_alerts(user_id):
             keyboard = get_alert_keyboards()['no_alerts']
             await query.edit_message_text(
@@ -288,11 +350,11 @@ Send /cancel to cancel."""
             )
             return
         
-        gas_data = fetch_gas_data()
-        current_gas = float(gas_data.get('ProposeGasPrice', 0)) if gas_data else 0
+        snapshot = await get_gas_cached()
+        current_gas = snapshot.propose if snapshot else 0
         
         alerts_text = AlertManager.format_alerts_message(user_id, current_gas)
-        keyboard = get_alert_keyboards()['alerts_view']
+        keyboard = get_alerts_view_keyboard(user_id)
         
         await query.edit_message_text(
             alerts_text,
@@ -306,31 +368,12 @@ Send /cancel to cancel."""
         
         message = f"✅ Cleared {count} alert(s) successfully!" if count > 0 else "No alerts to clear."
         
-        keyboard = InlineKeyboardMarkup([[
-            InlineKeyboardButton("⛽ Check Gas", callback_data="refresh")
-        ]])
-        
-        await query.edit_message_text(message, reply_markup=keyboard)
+        await query.edit_message_text(message, reply_markup=_CHECK_GAS_KB)
     # ========================================================================
     
     elif query.data == "help":
-        help_text = """<b>🤖 Quick Help</b>
-
-<b>Button Functions:</b>
-🔄 Refresh - Update gas prices
-⏰ Set Alert - Create price alerts
-📋 My Alerts - View your alerts
-ℹ️ Help - Show this message
-
-<b>Commands:</b>
-/gas - Get current prices
-/setalert - Set alert
-/myalerts - View alerts
-
-Use /help for detailed information."""
-        
         await query.edit_message_text(
-            help_text,
+            _QUICK_HELP_TEXT,
             parse_mode='HTML',
             reply_markup=create_main_keyboard()
         )
@@ -339,19 +382,45 @@ Use /help for detailed information."""
 # ============================================================================
 # MAIN FUNCTION
 # ============================================================================
+async def post_init(application: Application):
+    """Open shared resources once the event loop is running"""
+    await init_http_session()
+
+
+async def post_shutdown(application: Application):
+    """Release shared resources on shutdown"""
+    await close_http_session()
+
+
 def main():
     """Start the bot"""
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s',
+        level=logging.INFO
+    )
+    # httpx logs every Telegram API request at INFO
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    
     if not TELEGRAM_BOT_TOKEN:
-        print("❌ Error: TELEGRAM_BOT_TOKEN not found in .env file")
+        log.error("❌ Error: TELEGRAM_BOT_TOKEN not found in .env file")
         return
     
     if not ETHERSCAN_API_KEY:
-        print("❌ Error: ETHERSCAN_API_KEY not found in .env file")
+        log.error("❌ Error: ETHERSCAN_API_KEY not found in .env file")
         return
     
-    print("🤖 Starting Ethereum Gas Tracker Bot...")
+    log.info("🤖 Starting Ethereum Gas Tracker Bot...")
     
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    init_db()
+    log.info("✅ Restored %d alert(s) from database", restore_alerts())
+    
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     
     # ========================================================================
     # CONVERSATION HANDLER FOR ALERTS (NEW)
@@ -382,19 +451,51 @@ def main():
     application.add_handler(CallbackQueryHandler(button_callback))
     
     # ========================================================================
-    # ADD BACKGROUND JOB FOR ALERT CHECKING (NEW)
+    # BACKGROUND JOBS (CACHE REFRESH, ALERT CHECKING, CLEANUP)
     # ========================================================================
     job_queue = application.job_queue
+    
+    # Keep gas data and ETH price warm so handlers never wait on upstream.
+    # Gas moves every block; ETH/USD slowly, and CoinGecko is rate limited.
+    job_queue.run_repeating(
+        refresh_gas_job,
+        interval=GAS_REFRESH_INTERVAL,
+        first=0
+    )
+    job_queue.run_repeating(
+        refresh_eth_job,
+        interval=ETH_REFRESH_INTERVAL,
+        first=0
+    )
+    
     job_queue.run_repeating(
         check_and_notify_alerts,
         interval=ALERT_CHECK_INTERVAL,
         first=ALERT_CHECK_FIRST_RUN
     )
-    print(f"✅ Alert checker scheduled (every {ALERT_CHECK_INTERVAL}s)")
+    log.info("✅ Alert checker scheduled (every %ds)", ALERT_CHECK_INTERVAL)
+    
+    job_queue.run_repeating(
+        cleanup_alerts,
+        interval=ALERT_CLEANUP_INTERVAL,
+        first=ALERT_CLEANUP_INTERVAL
+    )
     # ========================================================================
     
-    print("✅ Bot is running! Press Ctrl+C to stop.")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    log.info("✅ Bot is running! Press Ctrl+C to stop.")
+    if WEBHOOK_URL:
+        # Telegram pushes updates to us; run_webhook registers the URL on startup
+        log.info("✅ Receiving updates via webhook on %s:%d", WEBHOOK_LISTEN, WEBHOOK_PORT)
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=urlparse(WEBHOOK_URL).path.lstrip('/'),
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == "__main__":
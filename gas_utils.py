@@ -1,10 +1,153 @@
-import requests
-from datetime import datetime
-from config import ETHERSCAN_API_KEY, GAS_LIMITS, GAS_STATUS_THRESHOLDS
+import asyncio
+import logging
+import random
+import time
+import aiohttp
+import orjson
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from config import (
+    ETHERSCAN_API_KEY,
+    GAS_LIMITS,
+    GAS_STATUS_THRESHOLDS,
+    HTTP_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_MIN_INTERVAL
+)
 
 
-def fetch_gas_data():
-    """Fetch gas data from Etherscan API"""
+log = logging.getLogger(__name__)
+
+# Shared aiohttp session, opened in the bot's post_init hook
+_http = None
+
+# url -> monotonic time reserved for the latest request to it
+_last_request_time = {}
+
+# Last CoinGecko ETag and the price it was served with, for conditional requests
+_eth_etag = None
+_eth_price = None
+
+# HTTP statuses worth retrying
+_RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+# Config lookups frozen at import so the render path doesn't hash dict keys
+_STATUS_THRESHOLDS = (
+    GAS_STATUS_THRESHOLDS['low'],
+    GAS_STATUS_THRESHOLDS['normal'],
+    GAS_STATUS_THRESHOLDS['elevated']
+)
+
+# One entry per bucket of _STATUS_THRESHOLDS (below low ... at/above elevated)
+_STATUSES = (
+    ("🟢 Gas is LOW", "Good time to transact!"),
+    ("🟡 Gas is NORMAL", "Standard network activity"),
+    ("🟠 Gas is ELEVATED", "Consider waiting if not urgent"),
+    ("🔴 Gas is HIGH", "Wait if transaction is not urgent!")
+)
+
+# Percent distance from the base fee separating the _TREND_LABELS buckets
+_TREND_STEPS = (-10, -3, 3, 10)
+
+_TREND_LABELS = ("↘️ Falling Fast", "↘️ Falling", "➡️ Stable", "↗️ Rising", "↗️ Rising Fast")
+
+_LIMITS = tuple(
+    GAS_LIMITS[k]
+    for k in ('eth_transfer', 'erc20_transfer', 'token_swap', 'nft_sale', 'bridging', 'borrowing')
+)
+
+
+@dataclass(slots=True, frozen=True)
+class GasSnapshot:
+    """Gas oracle prices (Gwei) and ETH price (USD), parsed once at fetch time"""
+    safe: float
+    propose: float
+    fast: float
+    base_fee: float
+    eth_price: float
+    fetched_at: float
+
+
+def parse_gas_snapshot(gas_data, eth_price, fetched_at: float):
+    """
+    Build a GasSnapshot from fetch_gas_data() output. Returns None if unavailable.
+    fetched_at is the UNIX time the gas data was fetched.
+    """
+    if not gas_data:
+        return None
+    
+    return GasSnapshot(
+        safe=gas_data['SafeGasPrice'],
+        propose=gas_data['ProposeGasPrice'],
+        fast=gas_data['FastGasPrice'],
+        base_fee=gas_data['suggestBaseFee'],
+        eth_price=eth_price,
+        fetched_at=fetched_at
+    )
+
+
+async def init_http_session():
+    """Create the shared HTTP session. Must be called from the running event loop."""
+    global _http
+    _http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=30),
+        timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+    )
+
+
+async def close_http_session():
+    """Close the shared HTTP session"""
+    global _http
+    if _http is not None:
+        await _http.close()
+        _http = None
+
+
+async def _throttle(url: str):
+    """Keep at least HTTP_MIN_INTERVAL seconds between requests to the same url"""
+    now = time.monotonic()
+    wait = _last_request_time.get(url, 0) + HTTP_MIN_INTERVAL - now
+    _last_request_time[url] = now + max(wait, 0)
+    if wait > 0:
+        await asyncio.sleep(wait)
+
+
+async def _get_json(url: str, params: dict, etag: str = None):
+    """
+    GET url and decode the JSON body, retrying transient failures with backoff
+    Connection errors, timeouts, 429 and 5xx responses are retried.
+    
+    If etag is given it is sent as If-None-Match.
+    
+    Returns:
+        (data, etag) tuple; data is None if the server answered 304 Not Modified
+    """
+    headers = {'If-None-Match': etag} if etag else None
+    for attempt in range(HTTP_RETRIES):
+        await _throttle(url)
+        try:
+            async with _http.get(url, params=params, headers=headers) as response:
+                if response.status == 304:
+                    return None, etag
+                response.raise_for_status()
+                return orjson.loads(await response.read()), response.headers.get('ETag')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # HTTP errors other than rate limiting/server errors won't fix themselves
+            retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in _RETRY_STATUSES
+            if not retryable or attempt == HTTP_RETRIES - 1:
+                raise
+            delay = min(2 ** attempt + random.random(), 8)
+            log.debug("Request to %s failed (%s), retrying in %.1fs", url, e, delay)
+            await asyncio.sleep(delay)
+
+
+async def fetch_gas_data():
+    """
+    Fetch gas data from Etherscan API
+    Prices are cast from Etherscan's strings to float Gwei here, once.
+    """
     url = "https://api.etherscan.io/v2/api"
     params = {
         'chainid': 1,
@@ -14,126 +157,91 @@ def fetch_gas_data():
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data, _ = await _get_json(url, params)
         
-        if data.get('status') == '1':
-            return data['result']
+        if data.get('status') != '1':
+            return None
+        
+        result = data['result']
+        propose = float(result['ProposeGasPrice'])
+        return {
+            'SafeGasPrice': float(result['SafeGasPrice']),
+            'ProposeGasPrice': propose,
+            'FastGasPrice': float(result['FastGasPrice']),
+            'suggestBaseFee': float(result.get('suggestBaseFee', propose))
+        }
+    except asyncio.TimeoutError:
+        log.warning("Timed out fetching gas data")
         return None
-    except Exception as e:
-        print(f"Error fetching gas data: {e}")
+    except (aiohttp.ClientError, KeyError, TypeError, ValueError) as e:
+        log.warning("Error fetching gas data: %s", e)
         return None
 
 
-def get_eth_price():
-    """Fetch current ETH price in USD"""
+async def get_eth_price():
+    """
+    Fetch current ETH price in USD
+    Sends the last ETag so an unchanged price costs a bodiless 304.
+    """
+    global _eth_etag, _eth_price
+    url = "https://api.coingecko.com/api/v3/simple/price"
+    params = {
+        'ids': 'ethereum',
+        'vs_currencies': 'usd'
+    }
+    
     try:
-        response = requests.get(
-            "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd",
-            timeout=10
-        )
-        data = response.json()
-        return data['ethereum']['usd']
-    except Exception as e:
-        print(f"Error fetching ETH price: {e}")
-        return 2500  # Fallback
-
-
-def calculate_tx_cost(gas_price_gwei, gas_limit, eth_price):
+        data, etag = await _get_json(url, params, _eth_etag)
+        if data is None:
+            return _eth_price
+        
+        _eth_price = float(data['ethereum']['usd'])
+        _eth_etag = etag
+        return _eth_price
+    except asyncio.TimeoutError:
+        log.warning("Timed out fetching ETH price")
+    except (aiohttp.ClientError, KeyError, TypeError, ValueError) as e:
+        log.warning("Error fetching ETH price: %s", e)
+    
+    # Keep serving the last good price; the fixed fallback is only for a cold start
+    return _eth_price if _eth_price is not None else 2500.0
+
+
+def usd_per_gas(gas_price_gwei: float, eth_price: float) -> float:
+    """USD cost of one unit of gas at the given gas price"""
+    return gas_price_gwei * 1e-9 * eth_price
+
+
+def calculate_tx_cost(gas_price_gwei: float, gas_limit: int, eth_price: float) -> float:
     """Calculate transaction cost in USD"""
-    try:
-        gas_price = float(gas_price_gwei)
-        gas_price_eth = gas_price * 1e-9
-        cost_eth = gas_price_eth * gas_limit
-        cost_usd = cost_eth * eth_price
-        return cost_usd
-    except Exception as e:
-        print(f"Error calculating tx cost: {e}")
-        return 0
+    return usd_per_gas(gas_price_gwei, eth_price) * gas_limit
 
 
-def get_gas_status(gas_price):
+@lru_cache(maxsize=256)
+def get_gas_status(gas_price: float):
     """Determine gas status based on price"""
-    try:
-        gas = float(gas_price)
-        if gas < GAS_STATUS_THRESHOLDS['low']:
-            return "🟢 Gas is LOW", "Good time to transact!"
-        elif gas < GAS_STATUS_THRESHOLDS['normal']:
-            return "🟡 Gas is NORMAL", "Standard network activity"
-        elif gas < GAS_STATUS_THRESHOLDS['elevated']:
-            return "🟠 Gas is ELEVATED", "Consider waiting if not urgent"
-        else:
-            return "🔴 Gas is HIGH", "Wait if transaction is not urgent!"
-    except:
-        return "🟡 Gas is NORMAL", "Standard network activity"
-
-
-def get_trend_indicator(current_gas, base_fee):
+    return _STATUSES[bisect_right(_STATUS_THRESHOLDS, gas_price)]
+
+
+@lru_cache(maxsize=256)
+def get_trend_indicator(current_gas: float, base_fee: float):
     """Improved trend indicator"""
-    try:
-        current = float(current_gas)
-        base = float(base_fee)
-        diff_percent = ((current - base) / base) * 100
-        
-        if diff_percent > 10:
-            return "↗️ Rising Fast"
-        elif diff_percent > 3:
-            return "↗️ Rising"
-        elif diff_percent < -10:
-            return "↘️ Falling Fast"
-        elif diff_percent < -3:
-            return "↘️ Falling"
-        else:
-            return "➡️ Stable"
-    except:
+    if not base_fee:
         return "➡️ Stable"
+    diff_percent = (current_gas - base_fee) * 100.0 / base_fee
+    # Exactly +/-3% is Stable and +/-10% is not yet Fast on either side
+    bucket = bisect_left if diff_percent > 0 else bisect_right
+    return _TREND_LABELS[bucket(_TREND_STEPS, diff_percent)]
 
 
-def format_gas_message(gas_data, eth_price):
-    """Format gas data into a beautiful message"""
-    if not gas_data:
-        return "❌ Unable to fetch gas data. Please try again later."
-    
-    safe_gas = gas_data.get('SafeGasPrice', 'N/A')
-    propose_gas = gas_data.get('ProposeGasPrice', 'N/A')
-    fast_gas = gas_data.get('FastGasPrice', 'N/A')
-    base_fee = gas_data.get('suggestBaseFee', propose_gas)
-    
-    status_emoji, status_text = get_gas_status(propose_gas)
-    trend = get_trend_indicator(propose_gas, base_fee)
-    
-    # Calculate costs
-    try:
-        simple_transfer = calculate_tx_cost(propose_gas, GAS_LIMITS['eth_transfer'], eth_price)
-        erc20_transfer = calculate_tx_cost(propose_gas, GAS_LIMITS['erc20_transfer'], eth_price)
-        token_swap = calculate_tx_cost(propose_gas, GAS_LIMITS['token_swap'], eth_price)
-        nft_sale = calculate_tx_cost(propose_gas, GAS_LIMITS['nft_sale'], eth_price)
-        bridging = calculate_tx_cost(propose_gas, GAS_LIMITS['bridging'], eth_price)
-        borrowing = calculate_tx_cost(propose_gas, GAS_LIMITS['borrowing'], eth_price)
-    except:
-        simple_transfer = erc20_transfer = token_swap = nft_sale = bridging = borrowing = 0
-    
-    # Format gas prices
-    try:
-        safe_gas_fmt = f"{float(safe_gas):.2f}"
-        propose_gas_fmt = f"{float(propose_gas):.2f}"
-        fast_gas_fmt = f"{float(fast_gas):.2f}"
-        base_fee_fmt = f"{float(base_fee):.2f}"
-    except:
-        safe_gas_fmt = safe_gas
-        propose_gas_fmt = propose_gas
-        fast_gas_fmt = fast_gas
-        base_fee_fmt = base_fee
-    
-    message = f"""⛽ <b>Ethereum Gas Tracker</b>
+_GAS_MSG_TMPL = """⛽ <b>Ethereum Gas Tracker</b>
 
 {status_emoji} <b>{status_text}</b>
 
 <b>Current Gas Prices:</b>
-🐌 Low: {safe_gas_fmt} Gwei
-⚡ Standard: {propose_gas_fmt} Gwei
-🚀 Fast: {fast_gas_fmt} Gwei
+🐌 Low: {safe_gas:.2f} Gwei
+⚡ Standard: {propose_gas:.2f} Gwei
+🚀 Fast: {fast_gas:.2f} Gwei
 
 <b>💰 Transaction Costs (Standard):</b>
 - ETH Transfer: ${simple_transfer:.2f}
@@ -144,10 +252,48 @@ def format_gas_message(gas_data, eth_price):
 - DeFi Borrow: ${borrowing:.2f}
 
 <b>📊 Network Info:</b>
-- Base Fee: {base_fee_fmt} Gwei
+- Base Fee: {base_fee:.2f} Gwei
 - Trend: {trend}
 - ETH Price: ${eth_price:,.2f}
 
-🕐 <i>Updated: {datetime.now().strftime('%H:%M:%S UTC')}</i>"""
+🕐 <i>Updated: {updated}</i>""".format
+
+
+@lru_cache(maxsize=8)
+def format_gas_message(snapshot):
+    """
+    Format a GasSnapshot into a beautiful message
+    Snapshots are immutable, so the rendered text is cached per snapshot.
+    """
+    if not snapshot:
+        return "❌ Unable to fetch gas data. Please try again later."
+    
+    propose_gas = snapshot.propose
+    eth_price = snapshot.eth_price
+    
+    status_emoji, status_text = get_gas_status(propose_gas)
+    trend = get_trend_indicator(propose_gas, snapshot.base_fee)
+    
+    # Calculate costs: USD per unit of gas once, then one multiply per tx type
+    gas_usd = usd_per_gas(propose_gas, eth_price)
+    simple_transfer, erc20_transfer, token_swap, nft_sale, bridging, borrowing = (
+        gas_usd * limit for limit in _LIMITS
+    )
     
-    return message
\ No newline at end of file
+    return _GAS_MSG_TMPL(
+        status_emoji=status_emoji,
+        status_text=status_text,
+        safe_gas=snapshot.safe,
+        propose_gas=propose_gas,
+        fast_gas=snapshot.fast,
+        simple_transfer=simple_transfer,
+        erc20_transfer=erc20_transfer,
+        token_swap=token_swap,
+        nft_sale=nft_sale,
+        bridging=bridging,
+        borrowing=borrowing,
+        base_fee=snapshot.base_fee,
+        trend=trend,
+        eth_price=eth_price,
+        updated=datetime.fromtimestamp(snapshot.fetched_at, timezone.utc).strftime('%H:%M:%S UTC')
+    )
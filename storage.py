@@ -0,0 +1,77 @@
+"""
+SQLite persistence for user alerts
+In-memory structures in alerts.py stay authoritative at runtime; every
+change is written through here so alerts survive bot restarts.
+"""
+import sqlite3
+from config import ALERTS_DB_PATH
+
+
+_conn = None
+
+
+def init_db(path: str = ALERTS_DB_PATH):
+    """Open the alerts database and create the schema if needed"""
+    global _conn
+    _conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    _conn.execute("PRAGMA journal_mode=WAL")
+    _conn.execute("PRAGMA synchronous=NORMAL")
+    # AUTOINCREMENT so ids of deleted/purged alerts are never handed out
+    # again and a stale del:<id> button can't hit a newer alert
+    _conn.execute("""
+        CREATE TABLE IF NOT EXISTS alerts (
+            alert_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            price REAL NOT NULL,
+            created_at INTEGER NOT NULL,
+            triggered INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    _conn.execute("CREATE INDEX IF NOT EXISTS idx_alerts_user ON alerts (user_id)")
+
+
+def load_alerts() -> list:
+    """Load all stored alerts as (alert_id, user_id, price, created_at, triggered) rows"""
+    return _conn.execute(
+        "SELECT alert_id, user_id, price, created_at, triggered FROM alerts ORDER BY alert_id"
+    ).fetchall()
+
+
+def save_alert(user_id: int, price: float, created_at: int) -> int:
+    """Insert a new untriggered alert. created_at is a UNIX timestamp. Returns the new alert id."""
+    cursor = _conn.execute(
+        "INSERT INTO alerts (user_id, price, created_at, triggered) VALUES (?, ?, ?, 0)",
+        (user_id, price, created_at)
+    )
+    return cursor.lastrowid
+
+
+def remove_alert(alert_id: int):
+    """Delete a single alert"""
+    _conn.execute("DELETE FROM alerts WHERE alert_id = ?", (alert_id,))
+
+
+def remove_user_alerts(user_id: int):
+    """Delete all alerts belonging to a user"""
+    _conn.execute("DELETE FROM alerts WHERE user_id = ?", (user_id,))
+
+
+def mark_triggered(alert_ids: list):
+    """Mark a batch of alerts as triggered in a single transaction"""
+    if not alert_ids:
+        return
+    with _conn:
+        _conn.execute("BEGIN")
+        _conn.executemany(
+            "UPDATE alerts SET triggered = 1 WHERE alert_id = ?",
+            [(alert_id,) for alert_id in alert_ids]
+        )
+
+
+def purge_triggered(created_before: int) -> int:
+    """Delete triggered alerts created before the given UNIX timestamp. Returns rows deleted."""
+    cursor = _conn.execute(
+        "DELETE FROM alerts WHERE triggered = 1 AND created_at < ?",
+        (created_before,)
+    )
+    return cursor.rowcount